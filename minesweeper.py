@@ -1,5 +1,74 @@
 import itertools
 import random
+import sys
+
+import numpy as np
+from numba import njit
+
+# Print debugging output about the board and the AI's reasoning
+VERBOSE = False
+
+
+@njit(cache=True)
+def nearby_mines_kernel(board, i, j, height, width):
+    """
+    Counts the mines in the cells around (i, j) on a boolean board.
+    """
+    count = 0
+    for di in range(-1, 2):
+        for dj in range(-1, 2):
+            ii = i + di
+            jj = j + dj
+            if di == 0 and dj == 0:
+                continue
+            if 0 <= ii < height and 0 <= jj < width and board[ii, jj]:
+                count += 1
+    return count
+
+
+@njit(cache=True)
+def neighbor_mask(i, j, height, width):
+    """
+    Returns the bitmask of the cells around (i, j), one bit per cell.
+    """
+    mask = np.uint64(0)
+    for di in range(-1, 2):
+        for dj in range(-1, 2):
+            ii = i + di
+            jj = j + dj
+            if di == 0 and dj == 0:
+                continue
+            if 0 <= ii < height and 0 <= jj < width:
+                mask |= np.uint64(1) << np.uint64(ii * width + jj)
+    return mask
+
+
+@njit(cache=True)
+def derive_sentences(masks, counts, start):
+    """
+    Returns the masks and counts of the sentences inferred from every
+    pair of sentences where one mask is a strict subset of the other,
+    skipping pairs where both sentences come before index start.
+    """
+    n = masks.shape[0]
+    pairs = (n * (n - 1) - start * (start - 1)) // 2
+    new_masks = np.empty(pairs, dtype=masks.dtype)
+    new_counts = np.empty(pairs, dtype=np.int64)
+    k = 0
+    for j in range(start, n):
+        for i in range(j):
+            if masks[i] == masks[j]:
+                continue
+            common = masks[i] & masks[j]
+            if common == masks[i]:
+                new_masks[k] = masks[j] & ~masks[i]
+                new_counts[k] = counts[j] - counts[i]
+                k += 1
+            elif common == masks[j]:
+                new_masks[k] = masks[i] & ~masks[j]
+                new_counts[k] = counts[i] - counts[j]
+                k += 1
+    return new_masks[:k], new_counts[:k]
 
 
 class Minesweeper():
@@ -15,20 +84,15 @@ class Minesweeper():
         self.mines = set()
 
         # Initialize an empty field with no mines
-        self.board = []
-        for i in range(self.height):
-            row = []
-            for j in range(self.width):
-                row.append(False)
-            self.board.append(row)
+        self.board = np.zeros((height, width), dtype=np.bool_)
 
         # Add mines randomly
-        while len(self.mines) != mines:
-            i = random.randrange(height)
-            j = random.randrange(width)
-            if not self.board[i][j]:
-                self.mines.add((i, j))
-                self.board[i][j] = True
+        flat = random.sample(range(height * width), mines)
+        self.board.flat[flat] = True
+        for p in flat:
+            i, j = divmod(p, width)
+            self.mines.add((i, j))
+            if VERBOSE:
                 print('mines: ', i, j)
 
         # At first, player has found no mines
@@ -39,19 +103,15 @@ class Minesweeper():
         Prints a text-based representation
         of where mines are located.
         """
-        for i in range(self.height):
-            print("--" * self.width + "-")
-            for j in range(self.width):
-                if self.board[i][j]:
-                    print("|X", end="")
-                else:
-                    print("| ", end="")
-            print("|")
-        print("--" * self.width + "-")
+        sep = "--" * self.width + "-\n"
+        rows = [
+            sep + "".join("|X" if is_mine else "| " for is_mine in row) + "|\n"
+            for row in self.board.tolist()
+        ]
+        sys.stdout.write("".join(rows) + sep)
 
     def is_mine(self, cell):
-        i, j = cell
-        return self.board[i][j]
+        return bool(self.board[cell])
 
     def nearby_mines(self, cell):
         """
@@ -59,24 +119,8 @@ class Minesweeper():
         within one row and column of a given cell,
         not including the cell itself.
         """
-
-        # Keep count of nearby mines
-        count = 0
-
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
-
-        return count
+        return nearby_mines_kernel(
+            self.board, cell[0], cell[1], self.height, self.width)
 
     def won(self):
         """
@@ -85,19 +129,89 @@ class Minesweeper():
         return self.mines_found == self.mines
 
 
+def cell_to_bit(cell, width):
+    """
+    Returns the bit representing a cell on a board of the given width.
+    """
+    return 1 << (cell[0] * width + cell[1])
+
+
+def mask_to_cells(mask, width):
+    """
+    Returns the set of cells whose bits are set in mask.
+    """
+    cells = set()
+    while mask:
+        bit = mask & -mask
+        cells.add(divmod(bit.bit_length() - 1, width))
+        mask ^= bit
+    return cells
+
+
+def bit_counts(masks):
+    """
+    Returns the number of cells in each mask of an array of masks.
+    """
+    if masks.dtype == object:
+        return np.array([mask.bit_count() for mask in masks.tolist()],
+                        dtype=np.int64)
+    return np.bitwise_count(masks)
+
+
+def random_cell(mask, width):
+    """
+    Returns a cell chosen at random among those whose bits are set in mask.
+    """
+    for _ in range(random.randrange(mask.bit_count())):
+        mask &= mask - 1
+    return divmod((mask & -mask).bit_length() - 1, width)
+
+
 class Sentence():
     """
     Logical statement about a Minesweeper game
     A sentence consists of a set of board cells,
     and a count of the number of those cells which are mines.
+
+    The cells are stored as a bitmask with one bit per board cell,
+    so set operations on sentences become integer operations.
     """
 
-    def __init__(self, cells, count):
-        self.cells = set(cells)
+    def __init__(self, cells, count, width):
+        self.width = width
+        self.cells_mask = 0
+        for cell in cells:
+            if not 0 <= cell[1] < width:
+                raise ValueError(
+                    f"cell {cell} is outside a board of width {width}")
+            self.cells_mask |= cell_to_bit(cell, width)
         self.count = count
 
+    @classmethod
+    def from_mask(cls, mask, count, width):
+        """
+        Builds a sentence directly from a cells bitmask.
+        """
+        sentence = cls((), count, width)
+        sentence.cells_mask = mask
+        return sentence
+
+    @property
+    def cells(self):
+        return mask_to_cells(self.cells_mask, self.width)
+
     def __eq__(self, other):
-        return self.cells == other.cells and self.count == other.count
+        if not isinstance(other, Sentence):
+            return NotImplemented
+        return (self.cells_mask == other.cells_mask
+                and self.count == other.count)
+
+    def __hash__(self):
+        """
+        Hashes the cells bitmask and count. A sentence must not be
+        marked while it is in a set or used as a dict key.
+        """
+        return hash((self.cells_mask, self.count))
 
     def __str__(self):
         return f"{self.cells} = {self.count}"
@@ -106,40 +220,36 @@ class Sentence():
         """
         Returns the set of all cells in self.cells known to be mines.
         """
-        mine_set = self.cells
-        return mine_set
+        if self.count == self.cells_mask.bit_count():
+            return self.cells
+        return set()
 
     def known_safes(self):
         """
         Returns the set of all cells in self.cells known to be safe.
         """
-        safe_set = self.cells
-        return safe_set
+        if self.count == 0:
+            return self.cells
+        return set()
 
     def mark_mine(self, cell):
         """
         Updates internal knowledge representation given the fact that
         a cell is known to be a mine.
         """
-        mine_cell =set()
-        mine_cell.add(cell)
-        if self.cells == mine_cell:
-            self.count = 1
-        elif self.cells > mine_cell:
-            self.cells = self.cells - mine_cell
-            self.count = self.count - 1
+        bit = cell_to_bit(cell, self.width)
+        if self.cells_mask & bit:
+            self.cells_mask &= ~bit
+            self.count -= 1
 
     def mark_safe(self, cell):
         """
         Updates internal knowledge representation given the fact that
         a cell is known to be safe.
         """
-        safe_cell =set()
-        safe_cell.add(cell)
-        if self.cells == safe_cell:
-            self.count = 0
-        elif self.cells > safe_cell:
-            self.cells = self.cells - safe_cell
+        bit = cell_to_bit(cell, self.width)
+        if self.cells_mask & bit:
+            self.cells_mask &= ~bit
 
 
 class MinesweeperAI():
@@ -153,6 +263,16 @@ class MinesweeperAI():
         self.height = height
         self.width = width
 
+        # Sentences are packed into uint64 bitmasks for the compiled
+        # kernels; boards over 64 cells keep Python ints in object arrays
+        # and run the kernels as plain Python
+        if height * width <= 64:
+            self._mask_dtype = np.uint64
+            self._derive_sentences = derive_sentences
+        else:
+            self._mask_dtype = object
+            self._derive_sentences = derive_sentences.py_func
+
         # Keep track of which cells have been clicked on
         self.moves_made = set()
 
@@ -160,26 +280,126 @@ class MinesweeperAI():
         self.mines = set()
         self.safes = set()
 
-        # List of sentences about the game known to be true
-        self.knowledge = []
+        # Bitmasks of cells still open to a move (not yet clicked on and
+        # not known to be mines), of known safe cells and of known mines
+        self.board_mask = (1 << (height * width)) - 1
+        self.available = self.board_mask
+        self.safe_mask = 0
+        self.mine_mask = 0
+
+        # Neighbors of every cell, indexed by i * width + j
+        if self._mask_dtype is np.uint64:
+            self.neighbor_masks = [
+                int(neighbor_mask(i, j, height, width))
+                for i in range(height) for j in range(width)
+            ]
+        else:
+            self.neighbor_masks = [
+                sum(cell_to_bit((ii, jj), width)
+                    for ii in range(max(0, i - 1), min(height, i + 2))
+                    for jj in range(max(0, j - 1), min(width, j + 2))
+                    if (ii, jj) != (i, j))
+                for i in range(height) for j in range(width)
+            ]
+
+        # Sentences about the game known to be true, stored column-wise:
+        # sentence k says counts[k] of the cells in masks[k] are mines.
+        # A sentence is dirty until it has been paired with every clean
+        # one, and again whenever marking a cell changes it
+        self._kb_masks = np.zeros(64, dtype=self._mask_dtype)
+        self._kb_counts = np.zeros(64, dtype=np.int64)
+        self._kb_dirty = np.zeros(64, dtype=np.bool_)
+        self._kb_len = 0
+
+    @property
+    def knowledge(self):
+        """
+        Tuple of sentences about the game known to be true.
+
+        This is a snapshot: the sentences are copies of the knowledge
+        base at the time of the call, so marking them or holding on to
+        the tuple does not change, or follow, what the AI knows.
+        """
+        masks = self._kb_masks[:self._kb_len].tolist()
+        counts = self._kb_counts[:self._kb_len].tolist()
+        return tuple(
+            Sentence.from_mask(mask, count, self.width)
+            for mask, count in zip(masks, counts)
+        )
+
+    def _add_sentences(self, masks, counts):
+        """
+        Appends sentences, given as arrays of cell masks and counts,
+        to the knowledge base as dirty, growing its buffers if needed.
+        """
+        end = self._kb_len + len(masks)
+        if end > len(self._kb_masks):
+            spare = max(end, 2 * len(self._kb_masks)) - self._kb_len
+            self._kb_masks = np.concatenate((
+                self._kb_masks[:self._kb_len],
+                np.zeros(spare, self._mask_dtype)))
+            self._kb_counts = np.concatenate((
+                self._kb_counts[:self._kb_len], np.zeros(spare, np.int64)))
+            self._kb_dirty = np.concatenate((
+                self._kb_dirty[:self._kb_len], np.zeros(spare, np.bool_)))
+        self._kb_masks[self._kb_len:end] = masks
+        self._kb_counts[self._kb_len:end] = counts
+        self._kb_dirty[self._kb_len:end] = True
+        self._kb_len = end
+
+    def _reduce_knowledge(self):
+        """
+        Drops empty and repeated sentences from the knowledge base and
+        moves the dirty sentences after the clean ones. Returns the set
+        of (mask, count) pairs kept and the index of the first dirty one.
+        """
+        order = np.argsort(self._kb_dirty[:self._kb_len], kind="stable")
+        masks = self._kb_masks[order].tolist()
+        counts = self._kb_counts[order].tolist()
+
+        # the first copy of a repeated sentence is the clean one, if any
+        kept = {}
+        for k, sentence in zip(order.tolist(), zip(masks, counts)):
+            if sentence[0]:
+                kept.setdefault(sentence, k)
+
+        index = np.array(list(kept.values()), dtype=np.intp)
+        self._kb_len = len(index)
+        self._kb_masks[:self._kb_len] = self._kb_masks[index]
+        self._kb_counts[:self._kb_len] = self._kb_counts[index]
+        self._kb_dirty[:self._kb_len] = self._kb_dirty[index]
+        start = self._kb_len - int(self._kb_dirty[:self._kb_len].sum())
+        return set(kept), start
 
     def mark_mine(self, cell):
         """
         Marks a cell as a mine, and updates all knowledge
         to mark that cell as a mine as well.
         """
+        bit = cell_to_bit(cell, self.width)
         self.mines.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_mine(cell)
+        self.mine_mask |= bit
+        self.available &= ~bit
+
+        masks = self._kb_masks[:self._kb_len]
+        hit = (masks & bit) != 0
+        masks[hit] &= self.board_mask ^ bit
+        self._kb_counts[:self._kb_len][hit] -= 1
+        self._kb_dirty[:self._kb_len][hit] = True
 
     def mark_safe(self, cell):
         """
         Marks a cell as safe, and updates all knowledge
         to mark that cell as safe as well.
         """
+        bit = cell_to_bit(cell, self.width)
         self.safes.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_safe(cell)
+        self.safe_mask |= bit
+
+        masks = self._kb_masks[:self._kb_len]
+        hit = (masks & bit) != 0
+        masks[hit] &= self.board_mask ^ bit
+        self._kb_dirty[:self._kb_len][hit] = True
 
     def add_knowledge(self, cell, count):
         """
@@ -198,89 +418,69 @@ class MinesweeperAI():
         """
         move = cell    # move as current revealed cell
         self.moves_made.add(move)
-        cells = set()
-        cells.add(move)
-        move_sentence = Sentence(cells, 0)
-        self.knowledge.append(move_sentence)
+        self.available &= ~cell_to_bit(move, self.width)
         self.mark_safe(move)
 
         # add a new sentence to the AI knowledge base and update
-        # loop cells as neighbors to the move
-        neighbor_cells = set()
-        for i in range(move[0]-1, move[0]+2):
-            for j in range(move[1]-1, move[1]+2):
-                if (i, j) == move:
-                    continue
-                if 0 <=i < self.height and 0 <= j <self.width:
-                    cell = (i, j)
-                    neighbor_cells.add(cell)
-        self.knowledge.append(Sentence(neighbor_cells, count))
+        # cells as neighbors to the move
+        neighbors = self.neighbor_masks[move[0] * self.width + move[1]]
+
+        # leave out neighbors already known to be safe or mines, as
+        # inference below works on the sentences exactly as stored
+        count -= (neighbors & self.mine_mask).bit_count()
+        neighbors &= ~(self.mine_mask | self.safe_mask)
+        neighbor_cells = mask_to_cells(neighbors, self.width)
+        self._add_sentences(
+            np.array([neighbors], dtype=self._mask_dtype),
+            np.array([count], dtype=np.int64))
 
         #  Update AI knowledge according to count and cells
-        n = -10000
         if count == 0:
             for cell in neighbor_cells:
                 self.mark_safe(cell)
-                n = 0
         elif count == len(neighbor_cells):
             for cell in neighbor_cells:
                 self.mark_mine(cell)
-                n = 1
-
-        if n >= -10:
-            for cell in neighbor_cells:
-                cells = set()
-                cells.add(cell)
-                self.knowledge.append(Sentence(cells, n))
 
         # add any new sentences to the AI's knowledge base
         # if they can be inferred from existing knowledge
-        new_knowledge = []
-        for sen in self.knowledge:
-            for sentence in self.knowledge:
-                if sen == sentence:
-                    continue
-                elif sen.cells < sentence.cells:
-                    new_set = sentence.cells - sen.cells
-                    new_count = sentence.count - sen.count
-                    new_knowledge.append(Sentence(new_set, new_count))
-
-                    if new_count == 0:
-                        for cell in new_set:
-                            self.mark_safe(cell)
-                    if new_count == len(new_set):
-                        for cell in new_set:
-                            self.mark_mine(cell)
-
-        self.knowledge.extend(new_knowledge)
-
-        for sentence in self.knowledge:
-            if sentence.count == 0:
-                safe_set = sentence.known_safes()
-                self.safes.union(safe_set)
-            if sentence.count == len(sentence.cells):
-                mine_set = sentence.known_mines()
-                self.mines.union(mine_set)
-
-        # reduce redundant sentences
-        knowledge_reduced = []
-        index_set = set()
-        for sentence in self.knowledge:
-            index = list()
-            for i in range(len(self.knowledge)):
-                if sentence.cells == self.knowledge[i].cells:
-                    index.append(i)
-            sorted(index)
-            index_set.add(tuple(index))
-
-        for index in index_set:
-            knowledge_reduced.append(self.knowledge[index[0]])
-
-        self.knowledge = knowledge_reduced
-
-        for sentence in self.knowledge:
-            print(sentence, len(self.knowledge))
 
+        # pair only dirty sentences, until nothing new is derived or marked
+        while True:
+            seen, start = self._reduce_knowledge()
+            if start == self._kb_len:
+                break
+
+            new_masks, new_counts = self._derive_sentences(
+                self._kb_masks[:self._kb_len], self._kb_counts[:self._kb_len],
+                start)
+            self._kb_dirty[:self._kb_len] = False
+            novel = [
+                sentence
+                for sentence in dict.fromkeys(
+                    zip(new_masks.tolist(), new_counts.tolist()))
+                if sentence not in seen
+            ]
+            if novel:
+                novel_masks, novel_counts = zip(*novel)
+                self._add_sentences(
+                    np.array(novel_masks, dtype=self._mask_dtype),
+                    np.array(novel_counts, dtype=np.int64))
+
+            # mark any cells that the knowledge base now settles
+            masks = self._kb_masks[:self._kb_len]
+            counts = self._kb_counts[:self._kb_len]
+            safe_set = int(np.bitwise_or.reduce(masks[counts == 0]))
+            mine_set = int(np.bitwise_or.reduce(
+                masks[counts == bit_counts(masks)]))
+            for cell in mask_to_cells(safe_set & ~self.safe_mask, self.width):
+                self.mark_safe(cell)
+            for cell in mask_to_cells(mine_set & ~self.mine_mask, self.width):
+                self.mark_mine(cell)
+
+        if VERBOSE:
+            for sentence in self.knowledge:
+                print(sentence, self._kb_len)
 
     def make_safe_move(self):
         """
@@ -291,10 +491,12 @@ class MinesweeperAI():
         This function may use the knowledge in self.mines, self.safes
         and self.moves_made, but should not modify any of those values.
         """
-        candidates = self.safes - self.moves_made
-        print('safe move candidates : ', candidates)
-        if len(candidates) > 0:
-            move = random.choice(list(candidates))
+        candidates = self.safe_mask & self.available
+        if VERBOSE:
+            print('safe move candidates : ',
+                  mask_to_cells(candidates, self.width))
+        if candidates:
+            move = random_cell(candidates, self.width)
             return move
         else:
             return None
@@ -306,15 +508,13 @@ class MinesweeperAI():
             1) have not already been chosen, and
             2) are not known to be mines
         """
-        all_cells = set()
-        for i in range(self.height):
-            for j in range(self.width):
-                all_cells.add((i, j))
-        random_candidates = all_cells - self.mines - self.moves_made
-        print('random move candidates : ', random_candidates)
+        random_candidates = self.available
+        if VERBOSE:
+            print('random move candidates : ',
+                  mask_to_cells(random_candidates, self.width))
 
-        if len(random_candidates) > 0:
-            move = random.choice(list(random_candidates))
+        if random_candidates:
+            move = random_cell(random_candidates, self.width)
             return move
         else:
             return None